@@ -1,15 +1,40 @@
 import pandas as pd
 import numpy as np
-import warnings
-import hashlib
-from functools import reduce
+import operator
 from io import BytesIO, StringIO
+from concurrent.futures import ThreadPoolExecutor
 import plotly.express as px
-from copy import deepcopy
 import xlsxwriter
 
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional; without it the kernels below run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 
 class Unit:
+    # fixed set of attributes, so no per-instance __dict__
+    __slots__ = (
+        "tradeID",
+        "long",
+        "price",
+        "time",
+        "tickNum",
+        "ATR",
+        "stopLossFactor",
+        "originalStopPrice",
+        "stopPrice",
+        "unitSize",
+        "lotSize",
+        "value",
+        "marginFactor",
+        "marginReq",
+        "secName",
+    )
 
     def __init__(
         self,
@@ -58,6 +83,108 @@ class Unit:
     with stop price {self.stopPrice} and ATR={self.ATR}."""
 
 
+class Positions:
+    """
+    Open units on one side (long or short) of a security, in order of entry.
+
+    Units are stored column-wise in preallocated NumPy arrays (one array per field,
+    with room for the security's maxUnits) so that checks over all open units, such
+    as stop losses, are single vectorized operations. Indexing or popping returns a
+    Unit rebuilt from the stored fields; changing that Unit does not change the
+    stored position.
+    """
+
+    def __init__(self, sec, long):
+        self.sec = sec
+        self.long = long
+        self.count = 0
+        # stops sit stopLossFactor ATRs below the entry price for longs, above for shorts
+        self.stopOffsetFactor = -sec.stopLossFactor if long else sec.stopLossFactor
+
+        capacity = sec.maxUnits
+        self.tradeID = np.empty(capacity, dtype=np.int64)
+        self.price = np.empty(capacity)
+        self.time = np.empty(capacity, dtype=object)
+        self.tickNum = np.empty(capacity, dtype=np.int64)
+        self.ATR = np.empty(capacity)
+        self.unitSize = np.empty(capacity, dtype=np.int64)
+        self.originalStopPrice = np.empty(capacity)
+        self.stopPrice = np.empty(capacity)
+        self.fields = [
+            self.tradeID,
+            self.price,
+            self.time,
+            self.tickNum,
+            self.ATR,
+            self.unitSize,
+            self.originalStopPrice,
+            self.stopPrice,
+        ]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("Positions index out of range")
+
+        unit = Unit(
+            tradeID=self.tradeID[index],
+            long=self.long,
+            price=self.price[index],
+            time=self.time[index],
+            tickNum=self.tickNum[index],
+            ATR=self.ATR[index],
+            stopLossFactor=self.sec.stopLossFactor,
+            unitSize=self.unitSize[index],
+            lotSize=self.sec.lotSize,
+            marginFactor=self.sec.marginFactor,
+            secName=self.sec.name,
+        )
+        unit.stopPrice = self.stopPrice[index]
+        return unit
+
+    def append(self, tradeID, price, time, tickNum, ATR, unitSize):
+        # store a new unit directly in the arrays, with its stop set as in Unit
+        index = self.count
+        self.tradeID[index] = tradeID
+        self.price[index] = price
+        self.time[index] = time
+        self.tickNum[index] = tickNum
+        self.ATR[index] = ATR
+        self.unitSize[index] = unitSize
+        self.originalStopPrice[index] = price + self.stopOffsetFactor * ATR
+        self.stopPrice[index] = self.originalStopPrice[index]
+        self.count += 1
+
+    def remove(self, index):
+        # returns the tradeID, price, unitSize and stopPrice of the removed unit
+        if index < 0:
+            index += self.count
+        removed = (
+            self.tradeID[index],
+            self.price[index],
+            self.unitSize[index],
+            self.stopPrice[index],
+        )
+        # shift later units down by one to keep the remaining units in order of entry
+        if index < self.count - 1:
+            for field in self.fields:
+                field[index : self.count - 1] = field[index + 1 : self.count]
+        self.count -= 1
+        return removed
+
+    def pop(self, index=-1):
+        unit = self[index]
+        self.remove(index)
+        return unit
+
+    def clear(self):
+        self.count = 0
+
+
 class Security:
 
     def __init__(
@@ -95,200 +222,162 @@ class Security:
             if slippagePerContract is None
             else slippagePerContract
         )
+        # round trip slippage of one contract unit, the same for every exit
+        self.slippagePerUnit = 2 * self.slippagePerContract * self.lotSize
 
         self.EMA_length_larger = self.Pf.EMA_length_larger
         self.EMA_length_smaller = self.Pf.EMA_length_smaller
         self.signal_EMA_length = self.Pf.signal_EMA_length
         self.smoothing = self.Pf.smoothing
+        # weights of each new value in the EMA updates, fixed for the life of the security
+        self.multiplierLarger = self.smoothing / (self.EMA_length_larger + 1)
+        self.multiplierSmaller = self.smoothing / (self.EMA_length_smaller + 1)
+        self.signalMultiplier = self.smoothing / (self.signal_EMA_length + 1)
         self.computeInitialMACD()  # specify the attributes it initializes and computes here TBD
 
-        self.longPositions = []
-        self.shortPositions = []
+        # the most recent initial prices seed the breakout windows of the first ticks
+        initialPrices = self.histData["price"].to_numpy(dtype=np.float64)
+        self.recentInitialPrices = initialPrices[-self.Pf.priceLookback :]
+
+        self.longPositions = Positions(self, long=True)
+        self.shortPositions = Positions(self, long=False)
 
         self.equity = 0
 
-        self.ATR = self.computeInitialATRs()
+        self.ATR = self.computeInitialATRs(initialPrices)
         self.unitSize = 0
         self.updateUnitSize()
+        # tick on which a new entry last sized this security's units
+        self.unitSizeTickNum = -1
 
         self.longEntryATR = 0
         self.shortEntryATR = 0
 
-    def computeInitialATRs(self):
-        histPriceData = self.histData["price"].values
-        TRlist = [
-            abs(histPriceData[i] - histPriceData[i - 1])
-            for i in range(1, self.ATRAverageRange + 1)
-        ]
-        ATR = np.mean(TRlist)
-        for i in range(self.ATRAverageRange + 1, len(histPriceData)):
-            TR = abs(histPriceData[i] - histPriceData[i - 1])
-            ATR = (((self.ATRAverageRange - 1) * ATR) + TR) / self.ATRAverageRange
-
-        return ATR
-
-    def updateATR(self, currPrice):
-        prevPrice = self.histData["price"].iat[-1]
-        trueRange = abs(currPrice - prevPrice)
-        self.ATR = (
-            ((self.ATRAverageRange - 1) * self.ATR) + trueRange
-        ) / self.ATRAverageRange
+    def computeInitialATRs(self, initialPrices):
+        TR = np.abs(np.diff(initialPrices))
+        # seed with the simple average of the first ATRAverageRange true ranges
+        ATR = TR[: self.ATRAverageRange].mean()
+        return wilderATR(TR[self.ATRAverageRange :], self.ATRAverageRange, ATR)
+
+    def prepareBreakoutRanges(self, prices, breakoutLengths):
+        # prices holds this security's price at every tick of the simulation; the lows and
+        # highs of every breakout window are computed up front in one pass per length
+        allPrices = np.concatenate((self.recentInitialPrices, prices))
+        self.breakoutRanges = {
+            breakoutLength: rollingMinMax(allPrices, breakoutLength)
+            for breakoutLength in breakoutLengths
+        }
 
-    def updateUnitSize(self):
+    def updateUnitSize(self, notionalAccountSize=None, price=None):
+        if notionalAccountSize is None:
+            notionalAccountSize = self.Pf.notionalAccountSize
         # compute Unit Sizes (i.e., number of contracts in one unit); truncate to ensure integer number
         self.unitSize = int(
-            (self.Pf.riskPercentOfAccount / 100 * self.Pf.notionalAccountSize)
+            (self.Pf.riskPercentOfAccount / 100 * notionalAccountSize)
             / (self.ATR * self.lotSize)
         )
         if self.unitSize < 0:
             self.unitSize = 0
-
-    def updateEMA(self, EMA, length, smoothing, price):
-        multiplier = smoothing / (length + 1)
-        EMA = price * multiplier + (1 - multiplier) * EMA
-        return EMA
-
-    def computeInitialEMAs(self, length):
-        priceData = self.histData["price"]
-        self.histData.loc[length - 1, str(length) + "-EMA"] = priceData[:length].mean()
-        for i in range(length, len(self.histData.index)):
-            self.histData.loc[i, str(length) + "-EMA"] = self.updateEMA(
-                EMA=self.histData.loc[i - 1, str(length) + "-EMA"],
-                length=length,
-                smoothing=self.smoothing,
-                price=self.histData.loc[i, "price"],
+        # when the entry price is known, also cap the unit so that its margin stays
+        # within the maximum margin per trade
+        if price is not None:
+            maxUnitSize = int(
+                self.Pf.maxMargin / (self.marginFactor * price * self.lotSize)
             )
-
-    def computeInitialMACD(self):
-        self.computeInitialEMAs(self.EMA_length_smaller)
-        self.computeInitialEMAs(self.EMA_length_larger)
-
-        self.histData["MACD"] = (
-            self.histData[str(self.EMA_length_smaller) + "-EMA"]
-            - self.histData[str(self.EMA_length_larger) + "-EMA"]
+            if self.unitSize > maxUnitSize:
+                self.unitSize = maxUnitSize
+
+    def computeInitialEMAs(self, length, multiplier):
+        # from pandas 3 on, to_numpy hands out read-only views of the frame's data, which
+        # the compiled kernels' signatures reject, so their inputs are taken as copies
+        prices = self.histData["price"].to_numpy(dtype=np.float64, copy=True)
+        EMAs = np.full(len(prices), np.nan)
+        # seed with the simple average of the first length prices
+        EMAs[length - 1] = prices[:length].mean()
+        emaRecurrence(
+            prices[length:],
+            multiplier,
+            EMAs[length - 1],
+            EMAs[length:],
         )
+        self.histData[str(length) + "-EMA"] = EMAs
+        return EMAs
 
-        self.histData.loc[
-            (self.EMA_length_larger - 1) + (self.signal_EMA_length - 1), "Signal"
-        ] = self.histData.loc[
-            (self.EMA_length_larger - 1) : (self.EMA_length_larger - 1)
-            + self.signal_EMA_length,
-            "MACD",
-        ].mean()
-        for i in range(
-            (self.EMA_length_larger - 1) + self.signal_EMA_length,
-            len(self.histData.index),
-        ):
-            self.histData.loc[i, "Signal"] = self.updateEMA(
-                EMA=self.histData.loc[i - 1, "Signal"],
-                length=self.signal_EMA_length,
-                smoothing=self.smoothing,
-                price=self.histData.loc[i - 1, "MACD"],
-            )
-
-        self.EMA_larger = self.histData[str(self.EMA_length_larger) + "-EMA"].iloc[-1]
-        self.EMA_smaller = self.histData[str(self.EMA_length_smaller) + "-EMA"].iloc[-1]
-        self.MACD = self.histData["MACD"].iloc[-1]
-        self.signal = self.histData["Signal"].iloc[-1]
-
-    def updateMACD(self, currPrice):
-        self.EMA_larger = self.updateEMA(
-            EMA=self.EMA_larger,
-            length=self.EMA_length_larger,
-            smoothing=self.smoothing,
-            price=currPrice,
-        )
-        self.EMA_smaller = self.updateEMA(
-            EMA=self.EMA_smaller,
-            length=self.EMA_length_smaller,
-            smoothing=self.smoothing,
-            price=currPrice,
-        )
-        self.MACD = self.EMA_smaller - self.EMA_larger
-        self.signal = self.updateEMA(
-            EMA=self.signal,
-            length=self.signal_EMA_length,
-            smoothing=self.smoothing,
-            price=self.MACD,
+    def computeInitialMACD(self):
+        # keep working on the computed arrays rather than looking the columns up again
+        EMAsSmaller = self.computeInitialEMAs(
+            self.EMA_length_smaller, self.multiplierSmaller
         )
-        lastRowIndex = len(self.histData.index) - 1
-        self.histData.loc[lastRowIndex, str(self.EMA_length_larger) + "-EMA"] = (
-            self.EMA_larger
+        EMAsLarger = self.computeInitialEMAs(
+            self.EMA_length_larger, self.multiplierLarger
         )
-        self.histData.loc[lastRowIndex, str(self.EMA_length_smaller) + "-EMA"] = (
-            self.EMA_smaller
+
+        MACDs = EMAsSmaller - EMAsLarger
+        self.histData["MACD"] = MACDs
+
+        signals = np.full(len(MACDs), np.nan)
+        seedIndex = (self.EMA_length_larger - 1) + (self.signal_EMA_length - 1)
+        # seed with the simple average of the first signal_EMA_length MACD values, then
+        # update each signal value with the MACD of the same row, as indicatorSeries does
+        signals[seedIndex] = MACDs[(self.EMA_length_larger - 1) : seedIndex + 1].mean()
+        emaRecurrence(
+            MACDs[seedIndex + 1 :],
+            self.signalMultiplier,
+            signals[seedIndex],
+            signals[seedIndex + 1 :],
         )
-        self.histData.loc[lastRowIndex, "MACD"] = self.MACD
-        self.histData.loc[lastRowIndex, "Signal"] = self.signal
+        self.histData["Signal"] = signals
 
-    def priceTotal(self, price, unitSize):
-        return price * unitSize * self.lotSize
+        # the indicators during the simulation continue from the end of the initial data,
+        # and its first tick compares against the second to last row of it
+        self.initialEMA_larger = EMAsLarger[-1]
+        self.initialEMA_smaller = EMAsSmaller[-1]
+        self.initialSignal = signals[-1]
+        self.initialPrevMACD = MACDs[-2]
+        self.initialPrevSignal = signals[-2]
 
     def goLong(self, price, time, tradeID, tickNum):
-        maxUnitSize = int(
-            self.Pf.maxMargin / (self.marginFactor * price * self.lotSize)
-        )
-        unitSize = maxUnitSize if self.unitSize > maxUnitSize else self.unitSize
+        # unitSize was capped for this price by updateUnitSize
+        unitSize = self.unitSize
 
-        newLongUnit = Unit(
+        self.longPositions.append(
             tradeID=tradeID,
-            long=True,
             price=price,
             time=time,
             tickNum=tickNum,
             ATR=self.longEntryATR,
             unitSize=unitSize,
-            secName=self.name,
-            stopLossFactor=self.stopLossFactor,
-            lotSize=self.lotSize,
-            marginFactor=self.marginFactor,
         )
-        self.longPositions.append(newLongUnit)
-        buyAmount = newLongUnit.value
+        buyAmount = price * unitSize * self.lotSize
         self.equity -= buyAmount
-        return newLongUnit
+        return unitSize, buyAmount, buyAmount * self.marginFactor
 
     def goShort(self, price, time, tradeID, tickNum):
-        maxUnitSize = int(
-            self.Pf.maxMargin / (self.marginFactor * price * self.lotSize)
-        )
-        unitSize = maxUnitSize if self.unitSize > maxUnitSize else self.unitSize
+        # unitSize was capped for this price by updateUnitSize
+        unitSize = self.unitSize
 
-        newShortUnit = Unit(
+        self.shortPositions.append(
             tradeID=tradeID,
-            long=False,
             price=price,
             time=time,
             tickNum=tickNum,
             ATR=self.shortEntryATR,
             unitSize=unitSize,
-            secName=self.name,
-            stopLossFactor=self.stopLossFactor,
-            lotSize=self.lotSize,
-            marginFactor=self.marginFactor,
         )
-        self.shortPositions.append(newShortUnit)
-        sellAmount = newShortUnit.value
+        sellAmount = price * unitSize * self.lotSize
         self.equity += sellAmount
-        return newShortUnit
+        return unitSize, sellAmount, sellAmount * self.marginFactor
 
     def getPopStats(self, sellPrice, buyPrice, unitSize):
-        buyValue = buyPrice * unitSize * self.lotSize
-        sellValue = sellPrice * unitSize * self.lotSize
+        lotSize = self.lotSize
+        transCostRate = self.transCost
+        slippage = self.slippagePerContract
+        buyValue = buyPrice * unitSize * lotSize
+        sellValue = sellPrice * unitSize * lotSize
         grossProfit = sellValue - buyValue
-        slippageCost = 2 * self.slippagePerContract * self.lotSize * unitSize
-        sellTransCost = (
-            self.transCost
-            * (sellPrice - self.slippagePerContract)
-            * self.lotSize
-            * unitSize
-        )
-        buyTransCost = (
-            self.transCost
-            * (buyPrice + self.slippagePerContract)
-            * self.lotSize
-            * unitSize
-        )
+        slippageCost = self.slippagePerUnit * unitSize
+        sellTransCost = transCostRate * (sellPrice - slippage) * lotSize * unitSize
+        buyTransCost = transCostRate * (buyPrice + slippage) * lotSize * unitSize
         transCost = sellTransCost + buyTransCost
         # below method is equivalent but above three lines are more obvious
         # transCost = self.transCost * (sellPrice + buyPrice) * self.lotSize * unitSize
@@ -296,29 +385,84 @@ class Security:
         return grossProfit, slippageCost, transCost, netProfit
 
     def popLongUnit(self, currPrice, index):
-        unit = self.longPositions.pop(index)
-        sellAmount = self.priceTotal(currPrice, unit.unitSize)
+        tradeID, entryPrice, unitSize, stopPrice = self.longPositions.remove(index)
+        marginReq = entryPrice * unitSize * self.lotSize * self.marginFactor
+        sellAmount = currPrice * unitSize * self.lotSize
         self.equity += sellAmount
         return (
-            unit,
+            tradeID,
+            stopPrice,
+            marginReq,
             sellAmount,
             *self.getPopStats(
-                sellPrice=currPrice, buyPrice=unit.price, unitSize=unit.unitSize
+                sellPrice=currPrice, buyPrice=entryPrice, unitSize=unitSize
             ),
         )
 
     def popShortUnit(self, currPrice, index):
-        unit = self.shortPositions.pop(index)
-        buyAmount = self.priceTotal(currPrice, unit.unitSize)
+        tradeID, entryPrice, unitSize, stopPrice = self.shortPositions.remove(index)
+        marginReq = entryPrice * unitSize * self.lotSize * self.marginFactor
+        buyAmount = currPrice * unitSize * self.lotSize
         self.equity -= buyAmount
         return (
-            unit,
+            tradeID,
+            stopPrice,
+            marginReq,
             buyAmount,
             *self.getPopStats(
-                sellPrice=unit.price, buyPrice=currPrice, unitSize=unit.unitSize
+                sellPrice=entryPrice, buyPrice=currPrice, unitSize=unitSize
             ),
         )
 
+    def popAllUnits(self, positions, currPrice):
+        # exit every unit in positions at currPrice with one vectorized pass over the
+        # stored fields; returns the per-unit exit stats in order of entry
+        numUnits = len(positions)
+        tradeIDs = positions.tradeID[:numUnits].copy()
+        stopPrices = positions.stopPrice[:numUnits].copy()
+        entryPrices = positions.price[:numUnits]
+        unitSizes = positions.unitSize[:numUnits]
+        marginReqs = entryPrices * unitSizes * self.lotSize * self.marginFactor
+        amount = currPrice * unitSizes.sum() * self.lotSize
+        if positions.long:
+            popStats = self.getPopStats(
+                sellPrice=currPrice, buyPrice=entryPrices, unitSize=unitSizes
+            )
+            self.equity += amount
+        else:
+            popStats = self.getPopStats(
+                sellPrice=entryPrices, buyPrice=currPrice, unitSize=unitSizes
+            )
+            self.equity -= amount
+        positions.clear()
+        return (tradeIDs, stopPrices, marginReqs, amount, *popStats)
+
+    def popAllLongUnits(self, currPrice):
+        return self.popAllUnits(self.longPositions, currPrice)
+
+    def popAllShortUnits(self, currPrice):
+        return self.popAllUnits(self.shortPositions, currPrice)
+
+    def getBreakoutRange(self, breakoutLength, tickNum, allowShorter=False):
+        # (low, high) of the last breakoutLength prices before tick tickNum; with fewer
+        # prices seen so far this is NaN, or the range of those prices if allowShorter
+        numPricesSeen = len(self.recentInitialPrices) + tickNum
+        if numPricesSeen < breakoutLength and not allowShorter:
+            return np.nan, np.nan
+        lows, highs = self.breakoutRanges[breakoutLength]
+        return lows[numPricesSeen - 1], highs[numPricesSeen - 1]
+
+    def getBreakoutRangeSeries(self, breakoutLength, numTicks):
+        # getBreakoutRange at every tick of the simulation at once
+        numRecentPrices = len(self.recentInitialPrices)
+        lows, highs = self.breakoutRanges[breakoutLength]
+        lows = lows[numRecentPrices - 1 : numRecentPrices - 1 + numTicks].copy()
+        highs = highs[numRecentPrices - 1 : numRecentPrices - 1 + numTicks].copy()
+        tooFewPrices = numRecentPrices + np.arange(numTicks) < breakoutLength
+        lows[tooFewPrices] = np.nan
+        highs[tooFewPrices] = np.nan
+        return lows, highs
+
     def isLongEntered(self):
         return len(self.longPositions) > 0
 
@@ -435,14 +579,27 @@ class Portfolio:
         self.exitType = exitType
         self.exitLongBreakout = exitLongBreakout
         self.exitShortBreakout = exitShortBreakout
-        self.exit_long_breakout_timedelta = pd.Timedelta(seconds=self.exitLongBreakout)
-        self.exit_short_breakout_timedelta = pd.Timedelta(
-            seconds=self.exitShortBreakout
+        # exit check for the chosen strategy, resolved once instead of every tick
+        self.checkExitsByType = {
+            "Timed": self.checkTimedExits,
+            "Breakout": self.checkBreakoutExits,
+            "MACD-Signal Crossover": self.checkMACDExits,
+        }.get(exitType)
+        if self.checkExitsByType is None:
+            raise RuntimeError(
+                "Portfolio attribute exitType is neither Timed, Breakout nor "
+                "MACD-Signal Crossover."
+            )
+
+        # number of most recent prices each security keeps for breakout checks
+        self.priceLookback = max(
+            longBreakout, shortBreakout, exitLongBreakout, exitShortBreakout
         )
 
         # size of notional account in rupees
         self.startingNotionalAccountSize = notionalAccountSize
         self.notionalAccountSize = notionalAccountSize
+        self.unitSizeAccountSize = notionalAccountSize
 
         self.adjustNotionalAccountSize = adjustNotionalAccountSize
 
@@ -518,8 +675,13 @@ class Portfolio:
             "Sec Status",
             "Pf Status",
         ]
+        self.tradeBookColumns = tradeBookColumns
         self.tradeBook = pd.DataFrame(columns=tradeBookColumns)
 
+        # rows of the trade book keyed by tradeID, collected during the simulation and
+        # turned into a DataFrame once at the end, rather than growing self.tradeBook row by row
+        self.tradeBookRows = {}
+
     def addSecurity(
         self,
         initialData,
@@ -542,25 +704,17 @@ class Portfolio:
             transCost=transCost,
             slippagePerContract=slippagePerContract,
         )
+        sec.secNo = len(self.securities)
         self.securities.append(sec)
 
-    def generateTradeID(self, timestamp, instrument):
-        # Create a unique string from timestamp and instrument
-        unique_string = f"{timestamp}_{instrument}"
-
-        # Use hashlib to create a hash of the unique string
-        hash_object = hashlib.md5(unique_string.encode())  # Using MD5
-        tradeID = (
-            hash_object.hexdigest()
-        )  # Converts the hash object to a hexadecimal string
-
-        return tradeID
+    def generateTradeID(self, tickNum, secNo):
+        # the tick and the position of the security in the portfolio identify an entry,
+        # so pack both into one integer rather than hashing a string
+        return (tickNum << 16) | secNo
 
     def goLong(self, sec, price, time, tickNum):
-        tradeID = self.generateTradeID(time, sec.name)
-        newLongUnit = sec.goLong(price, time, tradeID, tickNum)
-        buyAmount = newLongUnit.value
-        marginReq = newLongUnit.marginReq
+        tradeID = self.generateTradeID(tickNum, sec.secNo)
+        unitSize, buyAmount, marginReq = sec.goLong(price, time, tradeID, tickNum)
 
         self.marginTotal += marginReq
 
@@ -572,7 +726,7 @@ class Portfolio:
             "Security": sec.name,
             "Long / Short": "Long",
             "Entry Price": price,
-            "Position Size": newLongUnit.unitSize,
+            "Position Size": unitSize,
             "Lot Size": sec.lotSize,
             "ATR at Entry": sec.ATR,
             "Total Net Profits at Entry": self.totalNetProfits,
@@ -582,13 +736,11 @@ class Portfolio:
             "Sec Status": sec.getQuickSummary(),
             "Pf Status": self.getQuickSummary(),
         }
-        appendToDataFrame(self.tradeBook, newBookRow, tradeID)
+        self.tradeBookRows[tradeID] = newBookRow
 
     def goShort(self, sec, price, time, tickNum):
-        tradeID = self.generateTradeID(time, sec.name)
-        newShortUnit = sec.goShort(price, time, tradeID, tickNum)
-        sellAmount = newShortUnit.value
-        marginReq = newShortUnit.marginReq
+        tradeID = self.generateTradeID(tickNum, sec.secNo)
+        unitSize, sellAmount, marginReq = sec.goShort(price, time, tradeID, tickNum)
 
         self.marginTotal += marginReq
 
@@ -600,7 +752,7 @@ class Portfolio:
             "Security": sec.name,
             "Long / Short": "Short",
             "Entry Price": price,
-            "Position Size": newShortUnit.unitSize,
+            "Position Size": unitSize,
             "Lot Size": sec.lotSize,
             "ATR at Entry": sec.ATR,
             "Total Net Profits at Entry": self.totalNetProfits,
@@ -610,16 +762,23 @@ class Portfolio:
             "Sec Status": sec.getQuickSummary(),
             "Pf Status": self.getQuickSummary(),
         }
-        appendToDataFrame(self.tradeBook, newBookRow, tradeID)
+        self.tradeBookRows[tradeID] = newBookRow
 
     def popLong(self, sec, price, time, index):
-        unit, sellAmount, grossProfit, slippageCost, transCost, netProfit = (
-            sec.popLongUnit(price, index)
-        )
+        (
+            tradeID,
+            stopPrice,
+            marginReq,
+            sellAmount,
+            grossProfit,
+            slippageCost,
+            transCost,
+            netProfit,
+        ) = sec.popLongUnit(price, index)
         self.numLongPositions -= 1
         self.equity += sellAmount
         self.totalNetProfits += netProfit
-        self.marginTotal -= unit.marginReq
+        self.marginTotal -= marginReq
 
         columns_to_update = [
             "Stop Price",
@@ -633,7 +792,7 @@ class Portfolio:
             "ATR at Exit",
         ]
         values_to_update = [
-            unit.stopPrice,
+            stopPrice,
             time,
             self.exitType,
             price,
@@ -643,20 +802,27 @@ class Portfolio:
             netProfit,
             sec.ATR,
         ]
-        updateRowOfDataFrame(
-            self.tradeBook, unit.tradeID, values_to_update, columns_to_update
-        )
+        self.tradeBookRows[tradeID].update(zip(columns_to_update, values_to_update))
         if self.adjustNotionalAccountSize:
             self.notionalAccountSize += netProfit
 
+        return tradeID
+
     def popShort(self, sec, price, time, index):
-        unit, buyAmount, grossProfit, slippageCost, transCost, netProfit = (
-            sec.popShortUnit(price, index)
-        )
+        (
+            tradeID,
+            stopPrice,
+            marginReq,
+            buyAmount,
+            grossProfit,
+            slippageCost,
+            transCost,
+            netProfit,
+        ) = sec.popShortUnit(price, index)
         self.numShortPositions -= 1
         self.equity -= buyAmount
         self.totalNetProfits += netProfit
-        self.marginTotal -= unit.marginReq
+        self.marginTotal -= marginReq
 
         columns_to_update = [
             "Stop Price",
@@ -670,7 +836,7 @@ class Portfolio:
             "ATR at Exit",
         ]
         values_to_update = [
-            unit.stopPrice,
+            stopPrice,
             time,
             self.exitType,
             price,
@@ -680,19 +846,72 @@ class Portfolio:
             netProfit,
             sec.ATR,
         ]
-        updateRowOfDataFrame(
-            self.tradeBook, unit.tradeID, values_to_update, columns_to_update
-        )
+        self.tradeBookRows[tradeID].update(zip(columns_to_update, values_to_update))
         if self.adjustNotionalAccountSize:
             self.notionalAccountSize += netProfit
 
+        return tradeID
+
+    def closeTradeBookRows(
+        self,
+        sec,
+        price,
+        time,
+        tradeIDs,
+        stopPrices,
+        marginReqs,
+        grossProfits,
+        slippageCosts,
+        transCosts,
+        netProfits,
+    ):
+        # same bookkeeping as popLong / popShort, applied from the latest unit back
+        # to the earliest to match popping the units one at a time from the end
+        for unitNo in range(len(tradeIDs) - 1, -1, -1):
+            netProfit = netProfits[unitNo]
+            self.totalNetProfits += netProfit
+            self.marginTotal -= marginReqs[unitNo]
+            self.tradeBookRows[tradeIDs[unitNo]].update(
+                {
+                    "Stop Price": stopPrices[unitNo],
+                    "Exit Time": time,
+                    "Exit Type": self.exitType,
+                    "Exit Price": price,
+                    "Gross Profit": grossProfits[unitNo],
+                    "Slippage Cost": slippageCosts[unitNo],
+                    "Transaction Cost": transCosts[unitNo],
+                    "Net Profit": netProfit,
+                    "ATR at Exit": sec.ATR,
+                }
+            )
+            if self.adjustNotionalAccountSize:
+                self.notionalAccountSize += netProfit
+
     def exitAllLongSec(self, sec, currPrice, time):
-        while sec.longPositions:
-            self.popLong(sec, currPrice, time, -1)
+        if not sec.longPositions:
+            return []
+        tradeIDs, stopPrices, marginReqs, sellAmount, *popStats = sec.popAllLongUnits(
+            currPrice
+        )
+        self.numLongPositions -= len(tradeIDs)
+        self.equity += sellAmount
+        self.closeTradeBookRows(
+            sec, currPrice, time, tradeIDs, stopPrices, marginReqs, *popStats
+        )
+        return tradeIDs
 
     def exitAllShortSec(self, sec, currPrice, time):
-        while sec.shortPositions:
-            self.popShort(sec, currPrice, time, -1)
+        if not sec.shortPositions:
+            return []
+        tradeIDs, stopPrices, marginReqs, buyAmount, *popStats = sec.popAllShortUnits(
+            currPrice
+        )
+        self.numShortPositions -= len(tradeIDs)
+        self.equity -= buyAmount
+        self.closeTradeBookRows(
+            sec, currPrice, time, tradeIDs, stopPrices, marginReqs, *popStats
+        )
+        return tradeIDs
 
     def exitAllLong(self, currPriceList, time):
         for sec, currPrice in zip(self.securities, currPriceList):
@@ -727,155 +946,198 @@ class Portfolio:
             str(self.numLongPositions) + "L" + " " + str(self.numShortPositions) + "S"
         )
 
-    def updateATRs(self, currPriceList):
-        for sec, currPrice in zip(self.securities, currPriceList):
-            sec.updateATR(currPrice)
-
-    def updateMACD(self, currPriceList):
-        for sec, currPrice in zip(self.securities, currPriceList):
-            sec.updateMACD(currPrice)
+    def prepareIndicators(self, priceMatrix):
+        # ATR, MACD and signal only depend on prices, so their values at every tick are
+        # computed once before the simulation
+        securities = self.securities
+        self.ATRSeries, self.MACDSeries, self.signalSeries = indicatorSeries(
+            priceMatrix,
+            np.array(
+                [sec.recentInitialPrices[-1] for sec in securities], dtype=np.float64
+            ),
+            np.array([sec.ATR for sec in securities], dtype=np.float64),
+            np.array([sec.ATRAverageRange for sec in securities], dtype=np.float64),
+            np.array([sec.initialEMA_larger for sec in securities], dtype=np.float64),
+            np.array([sec.multiplierLarger for sec in securities], dtype=np.float64),
+            np.array([sec.initialEMA_smaller for sec in securities], dtype=np.float64),
+            np.array([sec.multiplierSmaller for sec in securities], dtype=np.float64),
+            np.array([sec.initialSignal for sec in securities], dtype=np.float64),
+            np.array([sec.signalMultiplier for sec in securities], dtype=np.float64),
+        )
+        # the previous values of the first tick are those of the initial data
+        self.prevMACDSeries = np.vstack(
+            ([sec.initialPrevMACD for sec in securities], self.MACDSeries[:-1])
+        )
+        self.prevSignalSeries = np.vstack(
+            ([sec.initialPrevSignal for sec in securities], self.signalSeries[:-1])
+        )
 
-    def updateUnitSizes(self):
-        for sec in self.securities:
-            sec.updateUnitSize()
+    def getBreakoutRangeMatrices(self, breakoutLength, numTicks):
+        lows, highs = zip(
+            *(
+                sec.getBreakoutRangeSeries(breakoutLength, numTicks)
+                for sec in self.securities
+            )
+        )
+        return np.column_stack(lows), np.column_stack(highs)
 
-    def updateHistData(self, currPriceList, timeStamp):
-        for sec, currPrice in zip(self.securities, currPriceList):
-            newRow = {"time": timeStamp, "price": currPrice}
-            appendToDataFrame(df=sec.histData, row=newRow)
-
-    def checkToAddNewUnit(self, sec, currPrice, time, tickNum, type, entryType):
-        priceCondition = True
-        currMACD = sec.MACD
-        prevMACD = sec.histData["MACD"].iat[-2]
-        currSignal = sec.signal
-        prevSignal = sec.histData["Signal"].iat[-2]
-        if type == "long":
-            entryATR = "longEntryATR"
-            tradingFunction = self.goLong
-        elif type == "short":
-            entryATR = "shortEntryATR"
-            tradingFunction = self.goShort
+    def prepareEntrySignals(self, priceMatrix):
+        # the entry conditions only depend on prices and indicators, so whether they hold
+        # is decided for every tick and security at once before the simulation
+        entryType = self.entryType
+        MACDs = self.MACDSeries
+        signals = self.signalSeries
+        prevMACDs = self.prevMACDSeries
+        prevSignals = self.prevSignalSeries
 
         # Three different type of mutually exclusive entries
+        longEntries = np.ones(MACDs.shape, dtype=bool)
+        shortEntries = np.ones(MACDs.shape, dtype=bool)
         if "Breakout" in entryType:
-            breakout_length = getattr(self, type + "Breakout")
-            # breakout_seconds = pd.Timedelta(seconds=breakout_length)
-            # recentData = sec.histData[sec.histData["time"] >= time - breakout_seconds]
-            recentData = sec.histData.iloc[-breakout_length:]
-            if len(recentData) < breakout_length:
-                prevHigh = np.nan
-                prevLow = np.nan
+            numTicks = len(priceMatrix)
+            longLows, longHighs = self.getBreakoutRangeMatrices(
+                self.longBreakout, numTicks
+            )
+            shortLows, shortHighs = self.getBreakoutRangeMatrices(
+                self.shortBreakout, numTicks
+            )
+            if self.longAtHigh:
+                longEntries = priceMatrix > longHighs
+                shortEntries = priceMatrix < shortLows
             else:
-                prevHigh = recentData["price"].max()
-                prevLow = recentData["price"].min()
-
-            if type == "long":
-                priceCondition = (
-                    currPrice > prevHigh if self.longAtHigh else currPrice < prevLow
-                )
-                if "MACD-Signal Condition" in entryType:
-                    priceCondition = priceCondition and (currMACD > currSignal)
-            elif type == "short":
-                priceCondition = (
-                    currPrice < prevLow if self.longAtHigh else currPrice > prevHigh
-                )
-                if "MACD-Signal Condition" in entryType:
-                    priceCondition = priceCondition and (currMACD < currSignal)
+                longEntries = priceMatrix < longLows
+                shortEntries = priceMatrix > shortHighs
+            if "MACD-Signal Condition" in entryType:
+                longEntries &= MACDs > signals
+                shortEntries &= MACDs < signals
         elif "MACD-Signal Crossover" in entryType:
-            if type == "long":
-                priceCondition = (currMACD > currSignal) and (prevMACD < prevSignal)
-            elif type == "short":
-                priceCondition = (currMACD < currSignal) and (prevMACD > prevSignal)
+            longEntries = (MACDs > signals) & (prevMACDs < prevSignals)
+            shortEntries = (MACDs < signals) & (prevMACDs > prevSignals)
         elif "MACD-Zero Crossover" in entryType:
-            if type == "long":
-                priceCondition = (currMACD > 0) and (prevMACD < 0)
-            elif type == "short":
-                priceCondition = (currMACD < 0) and (prevMACD > 0)
+            longEntries = (MACDs > 0) & (prevMACDs < 0)
+            shortEntries = (MACDs < 0) & (prevMACDs > 0)
 
         # Finally check the MACD sign condition
         if "Polarity Condition" in entryType:
-            if type == "long":
-                priceCondition = priceCondition and (prevSignal < 0)
-            elif type == "short":
-                priceCondition = priceCondition and (prevSignal > 0)
-
-        if priceCondition:
-            sec.updateUnitSize()
-            setattr(sec, entryATR, sec.ATR)
-            tradingFunction(sec, currPrice, time, tickNum)
+            longEntries &= prevSignals < 0
+            shortEntries &= prevSignals > 0
+
+        self.longEntrySignals = longEntries
+        self.shortEntrySignals = shortEntries
+
+    def prepareExitSignals(self):
+        # like the entries, MACD-Signal crossover exits are decided for every tick and
+        # security at once before the simulation
+        MACDs = self.MACDSeries
+        signals = self.signalSeries
+        prevMACDs = self.prevMACDSeries
+        prevSignals = self.prevSignalSeries
+        self.longExitSignals = (MACDs < signals) & (prevMACDs > prevSignals)
+        self.shortExitSignals = (MACDs > signals) & (prevMACDs < prevSignals)
+
+    def updateIndicators(self, tickNum):
+        # MACD and signal are only used through the entry and exit signals prepared
+        # before the simulation, so each security only needs its current ATR
+        for sec, ATR in zip(self.securities, self.ATRSeries[tickNum]):
+            sec.ATR = ATR
+
+    def updateUnitSizes(self):
+        # unit sizes are only used when a unit is added, so instead of recomputing them
+        # for every security every tick, remember the account size they are based on
+        # and let checkToAddMoreLong / checkToAddMoreShort compute them on demand
+        self.unitSizeAccountSize = self.notionalAccountSize
+
+    def checkToAddNewLong(self, sec, currPrice, time, tickNum):
+        if self.longEntrySignals[tickNum, sec.secNo]:
+            sec.updateUnitSize(price=currPrice)
+            sec.unitSizeTickNum = tickNum
+            sec.longEntryATR = sec.ATR
+            self.goLong(sec, currPrice, time, tickNum)
             return True
 
         return False
 
-    def checkToAddMoreUnits(self, sec, currPrice, time, tickNum, type):
-        if type == "long":
-            latestUnit = sec.longPositions[-1]
-            priceDifference = currPrice - latestUnit.price
-            entryATR = sec.longEntryATR
-            positions = sec.longPositions
-            adjustStopATRFactor = self.adjustStopATRFactor
-            tradingFunction = self.goLong
-        elif type == "short":
-            latestUnit = sec.shortPositions[-1]
-            priceDifference = latestUnit.price - currPrice
-            entryATR = sec.shortEntryATR
-            positions = sec.shortPositions
-            adjustStopATRFactor = -self.adjustStopATRFactor
-            tradingFunction = self.goShort
-        else:
-            raise RuntimeError("Invalid type in tryToAddMoreUnits.")
+    def checkToAddNewShort(self, sec, currPrice, time, tickNum):
+        if self.shortEntrySignals[tickNum, sec.secNo]:
+            sec.updateUnitSize(price=currPrice)
+            sec.unitSizeTickNum = tickNum
+            sec.shortEntryATR = sec.ATR
+            self.goShort(sec, currPrice, time, tickNum)
+            return True
 
-        if priceDifference >= self.extraUnitATRFactor * entryATR:
-            tradingFunction(sec, currPrice, time, tickNum)
+        return False
+
+    def adjustStops(self, positions, adjustStopATRFactor):
+        # each unit's stop moves by adjustStopATRFactor of its ATR for every unit added
+        # after it, the latest unit keeps its original stop
+        totalUnits = len(positions)
+        unitsAddedAfter = np.arange(totalUnits - 1, -1, -1)
+        positions.stopPrice[:totalUnits] = (
+            positions.originalStopPrice[:totalUnits]
+            + unitsAddedAfter * adjustStopATRFactor * positions.ATR[:totalUnits]
+        )
+
+    def checkToAddMoreLong(self, sec, currPrice, time, tickNum):
+        positions = sec.longPositions
+        priceDifference = currPrice - positions.price[len(positions) - 1]
+        if priceDifference >= self.extraUnitATRFactor * sec.longEntryATR:
+            # a new entry earlier in this tick already sized the units from the account
+            # size after stops and exits, otherwise size them from the start of the tick
+            if sec.unitSizeTickNum != tickNum:
+                sec.updateUnitSize(self.unitSizeAccountSize, currPrice)
+            self.goLong(sec, currPrice, time, tickNum)
             if self.adjustStopsOnMoreUnits:
-                totalUnitsNow = len(positions)
-                for unitNo, unit in enumerate(positions):
-                    unit.stopPrice = (
-                        unit.originalStopPrice
-                        + (totalUnitsNow - 1 - unitNo) * adjustStopATRFactor * unit.ATR
-                    )
+                self.adjustStops(positions, self.adjustStopATRFactor)
+            return True
+
+        return False
+
+    def checkToAddMoreShort(self, sec, currPrice, time, tickNum):
+        positions = sec.shortPositions
+        priceDifference = positions.price[len(positions) - 1] - currPrice
+        if priceDifference >= self.extraUnitATRFactor * sec.shortEntryATR:
+            # a new entry earlier in this tick already sized the units from the account
+            # size after stops and exits, otherwise size them from the start of the tick
+            if sec.unitSizeTickNum != tickNum:
+                sec.updateUnitSize(self.unitSizeAccountSize, currPrice)
+            self.goShort(sec, currPrice, time, tickNum)
+            if self.adjustStopsOnMoreUnits:
+                self.adjustStops(positions, -self.adjustStopATRFactor)
             return True
 
         return False
 
     def addUnits(self, currPriceList, time, tickNum, position_type):
         unitsAdded = 0
-        Position_type = position_type.capitalize()
+        if position_type == "long":
+            isPfLoaded = self.isLongLoaded
+            isSecEntered = Security.isLongEntered
+            checkToAddNewUnit = self.checkToAddNewLong
+            checkToAddMoreUnits = self.checkToAddMoreLong
+        elif position_type == "short":
+            isPfLoaded = self.isShortLoaded
+            isSecEntered = Security.isShortEntered
+            checkToAddNewUnit = self.checkToAddNewShort
+            checkToAddMoreUnits = self.checkToAddMoreShort
+        else:
+            raise RuntimeError("Invalid position type in addUnits.")
+
+        if self.addExtraUnits == "As new unit":
+            checkToAddExtraUnit = checkToAddNewUnit
+        elif self.addExtraUnits == "Using ATR":
+            checkToAddExtraUnit = checkToAddMoreUnits
+        elif self.addExtraUnits == "No":
+            checkToAddExtraUnit = None
+        else:
+            raise RuntimeError("Invalid type for Portfolio attribute addExtraUnits")
+
         for secNo, sec in enumerate(self.securities):
-            if (not sec.isLoaded()) and (
-                not getattr(self, f"is{Position_type}Loaded")()
-            ):
+            if (not sec.isLoaded()) and (not isPfLoaded()):
                 currPrice = currPriceList[secNo]
-                if not getattr(sec, f"is{Position_type}Entered")():
-                    unitsAdded += self.checkToAddNewUnit(
-                        sec=sec,
-                        currPrice=currPrice,
-                        time=time,
-                        tickNum=tickNum,
-                        type=position_type,
-                        entryType=self.entryType,
-                    )
-                else:
-                    if self.addExtraUnits == "As new unit":
-                        unitsAdded += self.checkToAddNewUnit(
-                            sec=sec,
-                            currPrice=currPrice,
-                            time=time,
-                            tickNum=tickNum,
-                            type=position_type,
-                            entryType=self.entryType,
-                        )
-                    elif self.addExtraUnits == "Using ATR":
-                        unitsAdded += self.checkToAddMoreUnits(
-                            sec, currPrice, time, tickNum, position_type
-                        )
-                    elif self.addExtraUnits == "No":
-                        pass
-                    else:
-                        raise RuntimeError(
-                            "Invalid type for Portfolio attribute addExtraUnits"
-                        )
+                if not isSecEntered(sec):
+                    unitsAdded += checkToAddNewUnit(sec, currPrice, time, tickNum)
+                elif checkToAddExtraUnit is not None:
+                    unitsAdded += checkToAddExtraUnit(sec, currPrice, time, tickNum)
         return unitsAdded
 
     def checkEntries(self, currPriceList, time, tickNum):
@@ -886,26 +1148,30 @@ class Portfolio:
 
     def checkStopsByPositionType(self, currPriceList, time, positionType):
         numStoppedOut = 0
+        # comparison of current price against stop price that triggers a stop out
         if positionType == "long":
-            stopCondition = "currPrice < unit.stopPrice"
+            stopCondition = operator.lt
+            popFunction = self.popLong
+            getPositions = operator.attrgetter("longPositions")
         elif positionType == "short":
-            stopCondition = "currPrice > unit.stopPrice"
-        popFunction = getattr(self, f"pop{positionType.capitalize()}")
+            stopCondition = operator.gt
+            popFunction = self.popShort
+            getPositions = operator.attrgetter("shortPositions")
 
         for secNo, sec in enumerate(self.securities):
-            positions = getattr(sec, f"{positionType}Positions")
+            positions = getPositions(sec)
+            if not positions:
+                continue
             currPrice = currPriceList[secNo]
-            for unitNo in range(len(positions) - 1, -1, -1):
-                unit = positions[unitNo]
-                if eval(stopCondition):
-                    popFunction(sec, currPrice, time, unitNo)
-                    updateRowOfDataFrame(
-                        df=self.tradeBook,
-                        index=unit.tradeID,
-                        values=["Stop out"],
-                        columns=["Exit Type"],
-                    )
-                    numStoppedOut += 1
+            # compare against the stops of all open units at once, then pop the
+            # stopped out units from the back so earlier indices stay valid
+            stoppedOut = np.flatnonzero(
+                stopCondition(currPrice, positions.stopPrice[: len(positions)])
+            )
+            for unitNo in stoppedOut[::-1]:
+                tradeID = popFunction(sec, currPrice, time, unitNo)
+                self.tradeBookRows[tradeID]["Exit Type"] = "Stop out"
+                numStoppedOut += 1
 
         return numStoppedOut
 
@@ -914,104 +1180,113 @@ class Portfolio:
         if not self.useStops:
             return
 
-        totalStoppedOut = self.checkStopsByPositionType(
-            currPriceList=currPriceList, time=time, positionType="long"
-        ) + self.checkStopsByPositionType(
-            currPriceList=currPriceList, time=time, positionType="short"
-        )
+        totalStoppedOut = 0
+        if self.numLongPositions:
+            totalStoppedOut += self.checkStopsByPositionType(
+                currPriceList=currPriceList, time=time, positionType="long"
+            )
+        if self.numShortPositions:
+            totalStoppedOut += self.checkStopsByPositionType(
+                currPriceList=currPriceList, time=time, positionType="short"
+            )
 
         return totalStoppedOut
 
-    def checkExits(self, currPriceList, time, tickNum):
-
+    def checkTimedExits(self, currPriceList, time, tickNum):
         numExits = 0
-
-        if self.exitType == "Timed":
-            for sec, currPrice in zip(self.securities, currPriceList):
-                # can only check the first position each time because positions are stored
-                # in ascending order w.r.t. time
-                while sec.longPositions and (
-                    tickNum - sec.longPositions[0].tickNum >= self.exitLongBreakout
-                ):
+        # units entered at or before these ticks have been held for the exit period
+        lastLongEntryTick = tickNum - self.exitLongBreakout
+        lastShortEntryTick = tickNum - self.exitShortBreakout
+        for sec, currPrice in zip(self.securities, currPriceList):
+            # positions are stored in ascending order of entry tick, so the expired
+            # units are always the first numExpired ones, and there are none unless
+            # the oldest unit has expired
+            positions = sec.longPositions
+            if positions and positions.tickNum[0] <= lastLongEntryTick:
+                numExpired = np.searchsorted(
+                    positions.tickNum[: len(positions)],
+                    lastLongEntryTick,
+                    side="right",
+                )
+                for _ in range(numExpired):
                     self.popLong(sec, currPrice, time, 0)
-                    numExits += 1
-                while sec.shortPositions and (
-                    tickNum - sec.shortPositions[0].tickNum >= self.exitShortBreakout
-                ):
+                numExits += numExpired
+            positions = sec.shortPositions
+            if positions and positions.tickNum[0] <= lastShortEntryTick:
+                numExpired = np.searchsorted(
+                    positions.tickNum[: len(positions)],
+                    lastShortEntryTick,
+                    side="right",
+                )
+                for _ in range(numExpired):
                     self.popShort(sec, currPrice, time, 0)
-                    numExits += 1
-        elif self.exitType == "Breakout":
-            for sec, currPrice in zip(self.securities, currPriceList):
-                histPriceData = sec.histData["price"]
-                if sec.isLongEntered():
-                    prevLow = histPriceData[-self.exitLongBreakout :].min()
-                    if currPrice < prevLow:
-                        while sec.longPositions:
-                            unit = sec.longPositions[-1]
-                            self.popLong(sec, currPrice, time, -1)
-                            updateRowOfDataFrame(
-                                df=self.tradeBook,
-                                index=unit.tradeID,
-                                values=[prevLow],
-                                columns=["Breakout Exit Price"],
-                            )
-                            numExits += 1
-                if sec.isShortEntered():
-                    prevHigh = histPriceData[-self.exitLongBreakout :].max()
-                    if currPrice > prevHigh:
-                        while sec.shortPositions:
-                            unit = sec.shortPositions[-1]
-                            self.popShort(sec, currPrice, time, -1)
-                            updateRowOfDataFrame(
-                                df=self.tradeBook,
-                                index=unit.tradeID,
-                                values=[prevHigh],
-                                columns=["Breakout Exit Price"],
-                            )
-                            numExits += 1
-        elif self.exitType == "MACD-Signal Crossover":
-            for sec, currPrice in zip(self.securities, currPriceList):
-                currMACD = sec.MACD
-                prevMACD = sec.histData["MACD"].iat[-2]
-                currSignal = sec.signal
-                prevSignal = sec.histData["Signal"].iat[-2]
-                if (currMACD < currSignal) and (prevMACD > prevSignal):
-                    while sec.longPositions:
-                        unit = sec.longPositions[-1]
-                        self.popLong(sec, currPrice, time, -1)
-                        numExits += 1
-                if (currMACD > currSignal) and (prevMACD < prevSignal):
-                    while sec.shortPositions:
-                        unit = sec.shortPositions[-1]
-                        self.popShort(sec, currPrice, time, -1)
-                        numExits += 1
+                numExits += numExpired
+        return numExits
 
-        else:
-            raise RuntimeError(
-                "Portfolio attribute exitType is neither Timed nor Breakout."
+    def checkBreakoutExits(self, currPriceList, time, tickNum):
+        numExits = 0
+        for sec, currPrice in zip(self.securities, currPriceList):
+            if not (sec.isLongEntered() or sec.isShortEntered()):
+                continue
+            prevLow, prevHigh = sec.getBreakoutRange(
+                self.exitLongBreakout, tickNum, allowShorter=True
             )
+            if sec.isLongEntered():
+                if currPrice < prevLow:
+                    tradeIDs = self.exitAllLongSec(sec, currPrice, time)
+                    for tradeID in tradeIDs:
+                        self.tradeBookRows[tradeID]["Breakout Exit Price"] = prevLow
+                    numExits += len(tradeIDs)
+            if sec.isShortEntered():
+                if currPrice > prevHigh:
+                    tradeIDs = self.exitAllShortSec(sec, currPrice, time)
+                    for tradeID in tradeIDs:
+                        self.tradeBookRows[tradeID]["Breakout Exit Price"] = prevHigh
+                    numExits += len(tradeIDs)
+        return numExits
 
+    def checkMACDExits(self, currPriceList, time, tickNum):
+        numExits = 0
+        longExits = self.longExitSignals[tickNum]
+        shortExits = self.shortExitSignals[tickNum]
+        # only visit the securities with a crossover this tick, in portfolio order
+        for secNo in np.flatnonzero(longExits | shortExits):
+            sec = self.securities[secNo]
+            currPrice = currPriceList[secNo]
+            if longExits[secNo]:
+                numExits += len(self.exitAllLongSec(sec, currPrice, time))
+            if shortExits[secNo]:
+                numExits += len(self.exitAllShortSec(sec, currPrice, time))
         return numExits
 
-    def preparePortfolioFromDataFrames(self, dataframesDict, lotSizeDict=None):
-        dataframesDict = deepcopy(dataframesDict)
+    def checkExits(self, currPriceList, time, tickNum):
+
+        # nothing to exit while the portfolio is flat
+        if not (self.numLongPositions or self.numShortPositions):
+            return 0
 
+        return self.checkExitsByType(currPriceList, time, tickNum)
+
+    def preparePortfolioFromDataFrames(self, dataframesDict, lotSizeDict=None):
         # Function to merge DataFrames on 'time'
         def merge_dfs_on_time(df_list):
-            # Use functools.reduce to perform cumulative inner merge
-            merged_df = reduce(
-                lambda left, right: pd.merge(left, right, on="time", how="inner"),
-                df_list,
+            # align all DataFrames on their times at once, keeping only the times they
+            # share, rather than merging them pairwise
+            merged_df = pd.concat(
+                [df.set_index("time") for df in df_list], axis=1, join="inner"
             )
-            merged_df.reset_index(drop=True, inplace=True)
+            merged_df.reset_index(inplace=True)
             return merged_df
 
         # Preparing each DataFrame by renaming the 'price' column to a unique name
-        for i, df in enumerate(dataframesDict.values()):
-            df.rename(columns={"price": f"price_{i + 1}"}, inplace=True)
+        # (rename returns new frames, so the passed dictionary is left untouched)
+        renamedDfs = [
+            df.rename(columns={"price": f"price_{i + 1}"})
+            for i, df in enumerate(dataframesDict.values())
+        ]
 
         # Merge all DataFrames
-        df = merge_dfs_on_time(list(dataframesDict.values()))
+        df = merge_dfs_on_time(renamedDfs)
 
         # # Retain only the longest continuous sequence of data points
         # df = retain_largest_continuous_sequence(df)
@@ -1021,9 +1296,16 @@ class Portfolio:
         # Get a list of all columns that start with 'price_'
         price_columns = [col for col in df.columns if col.startswith("price_")]
 
+        # each security only gets its own slice of the initial data, built straight from
+        # the underlying arrays rather than selecting, copying and renaming a sub-frame
+        initialTimes = df["time"].iloc[: self.minLengthOfInitialData].to_numpy()
         for col, secName in zip(price_columns, dataframesDict.keys()):
-            initialData = df.iloc[: self.minLengthOfInitialData][["time", col]].copy()
-            initialData.rename(columns={col: "price"}, inplace=True)
+            initialData = pd.DataFrame(
+                {
+                    "time": initialTimes,
+                    "price": df[col].iloc[: self.minLengthOfInitialData].to_numpy(),
+                }
+            )
             if lotSizeDict is None:
                 self.addSecurity(initialData=initialData, name=secName)
             else:
@@ -1031,47 +1313,68 @@ class Portfolio:
                     initialData=initialData, name=secName, lotSize=lotSizeDict[secName]
                 )
 
-        df = df.iloc[self.minLengthOfInitialData :].copy()
-        df.reset_index(inplace=True, drop=True)
-
-        self.priceData = df
+        self.priceData = df.iloc[self.minLengthOfInitialData :].reset_index(drop=True)
+        # Pull times and prices out as NumPy arrays once, so that each tick of the
+        # simulation is a plain array lookup rather than a pandas row
+        self.priceMatrix = self.priceData[price_columns].to_numpy(
+            dtype=np.float64, copy=True
+        )
+        self.timeArray = self.priceData["time"].to_numpy()
 
     def run_simulation(self, progress_callback=None):
-        # Cache the locations of price columns once, outside of the loop
-        price_column_numbers = [
-            self.priceData.columns.get_loc(col)
-            for col in self.priceData.columns
-            if col.startswith("price")
-        ]
-
-        def get_time_and_prices(row):
-            # Extract time and prices from a given row
-            time = row["time"]
-            prices = [row.iloc[col] for col in price_column_numbers]
-            return time, prices
+        price_matrix = self.priceMatrix
+        time_array = self.timeArray
 
-        total_rows = len(self.priceData.index)
+        breakoutLengths = {self.longBreakout, self.shortBreakout, self.exitLongBreakout}
+        for secNo, sec in enumerate(self.securities):
+            sec.prepareBreakoutRanges(price_matrix[:, secNo], breakoutLengths)
+        self.prepareIndicators(price_matrix)
+        self.prepareEntrySignals(price_matrix)
+        self.prepareExitSignals()
+
+        total_rows = len(time_array)
+        # report progress about 200 times over the run (and on the last tick) rather than
+        # on every tick, as each report is a round trip to the Streamlit frontend
+        progress_step = max(1, total_rows // 200)
         for rowNo in range(total_rows):
-            row = self.priceData.iloc[rowNo]
-            time, prices = get_time_and_prices(row)
-            self.updateATRs(prices)
-            self.updateMACD(prices)
+            time = time_array[rowNo]
+            prices = price_matrix[rowNo]
+            self.updateIndicators(rowNo)
             self.updateUnitSizes()
             self.checkStops(prices, time)
             self.checkExits(currPriceList=prices, time=time, tickNum=rowNo)
             self.checkEntries(currPriceList=prices, time=time, tickNum=rowNo)
-            self.updateHistData(prices, time)
 
             # Update progress bar if a callback is provided
-            if progress_callback:
+            if progress_callback and (
+                rowNo % progress_step == 0 or rowNo == total_rows - 1
+            ):
                 progress_callback((rowNo + 1) / total_rows)
 
         # Handle final row
-        final_row = self.priceData.iloc[-1]
-        time, prices = get_time_and_prices(final_row)
-        self.exitAll(prices, time)
+        self.exitAll(price_matrix[-1], time_array[-1])
+        self.finalizeTradeBook()
         self.processTradeBook()
 
+    def finalizeTradeBook(self):
+        # build the trade book in one go from the rows collected during the simulation
+        self.tradeBook = pd.DataFrame(
+            list(self.tradeBookRows.values()),
+            index=list(self.tradeBookRows.keys()),
+            columns=self.tradeBookColumns,
+        )
+        # these columns only take a handful of distinct values
+        categoryColumns = [
+            "Security",
+            "Long / Short",
+            "Exit Type",
+            "Sec Status",
+            "Pf Status",
+        ]
+        self.tradeBook = self.tradeBook.astype(
+            dict.fromkeys(categoryColumns, "category")
+        )
+
     def processTradeBook(self):
         # self.tradeBook["Running Net Profit"] = self.tradeBook["Net Profit"].cumsum()
         # self.totalNetProfits = self.tradeBook["Net Profit"].sum()
@@ -1199,8 +1502,19 @@ class Portfolio:
 
 
 def prepareDataFramesFromExcel(excel_file, sheet_names):
+    # Only the time and price columns are used, so skip parsing every other column
+    def is_time_or_price_col(col):
+        col = str(col).lower()
+        return "time" in col or "net" in col or "amount" in col or "price" in col
+
     # Retrieve a dictionary of dataframes, with sheet_name as key
-    dataframesDict = pd.read_excel(excel_file, sheet_name=list(sheet_names), header=1)
+    dataframesDict = pd.read_excel(
+        excel_file,
+        sheet_name=list(sheet_names),
+        header=1,
+        engine="openpyxl",
+        usecols=is_time_or_price_col,
+    )
 
     # Process each sheet
     for key, df in dataframesDict.items():
@@ -1225,13 +1539,16 @@ def prepareDataFramesFromExcel(excel_file, sheet_names):
         # Rename columns based on detected names
         df.rename(columns={time_col: "time", price_col: "price"}, inplace=True)
 
-        # Convert 'time' to datetime
-        try:
-            df["time"] = pd.to_datetime(
-                df["time"], format="%d/%m/%Y, %I:%M:%S %p", errors="raise"
-            )
-        except ValueError:
-            pass
+        # Convert 'time' to datetime, unless Excel already stored the cells as dates
+        if not pd.api.types.is_datetime64_any_dtype(df["time"]):
+            try:
+                df["time"] = pd.to_datetime(
+                    df["time"],
+                    format="%d/%m/%Y, %I:%M:%S %p",
+                    errors="raise",
+                )
+            except ValueError:
+                pass
 
         df["price"] = pd.to_numeric(df["price"], errors="coerce").abs()
 
@@ -1248,7 +1565,7 @@ def prepareDataFramesFromExcel(excel_file, sheet_names):
         # df.sort_values(by="time", ascending=True, inplace=True)
 
         # Reassign cleaned dataframe back to dictionary
-        dataframesDict[key] = df[["time", "price"]].copy()
+        dataframesDict[key] = df[["time", "price"]]
 
     return dataframesDict
 
@@ -1265,19 +1582,24 @@ def computeEdgeRatios(
     getPlots=False,
 ):
 
-    # ensure we do not alter the original passed dictionary of dataframes by using a deepcopy instead
-    dfDict = deepcopy(dfDict)
-
     def computeBreakoutsAndATRs(df):
-        df["price"] = abs(df["price"])
-        df["TR"] = abs(df["price"].diff())
-        df = df.drop(df.index[0])
-        df.reset_index(inplace=True, drop=True)
-        df.loc[ATRAverageRange, "ATR"] = df.loc[1:ATRAverageRange, "TR"].mean()
-        for i in range(ATRAverageRange + 1, len(df.index)):
-            df.loc[i, "ATR"] = (
-                (ATRAverageRange - 1) * df.loc[i - 1, "ATR"] + df.loc[i, "TR"]
-            ) / ATRAverageRange
+        prices = np.abs(df["price"].to_numpy(dtype=np.float64))
+        TRs = np.abs(np.diff(prices))
+        # the first price has no true range, so its row is dropped; the columns below are
+        # written to this new frame, the passed dataframes are left untouched
+        df = df.iloc[1:].reset_index(drop=True)
+        df["price"] = prices[1:]
+        df["TR"] = TRs
+        ATRs = np.full(len(TRs), np.nan)
+        if len(TRs) > ATRAverageRange:
+            ATRs[ATRAverageRange] = TRs[1 : ATRAverageRange + 1].mean()
+            wilderATRRecurrence(
+                TRs[ATRAverageRange + 1 :],
+                ATRAverageRange,
+                ATRs[ATRAverageRange],
+                ATRs[ATRAverageRange + 1 :],
+            )
+        df["ATR"] = ATRs
 
         df["highs"] = (
             df["price"]
@@ -1307,50 +1629,20 @@ def computeEdgeRatios(
     numtimePeriods = len(timePeriods)
 
     def computeEdgeRatiosAndSumsForSec(df):
-        prices = df["price"].values
-        atrs = df["ATR"].values
-        long_entries = df["longEntry"].values
-        short_entries = df["shortEntry"].values
+        # copies for the compiled kernel, see computeInitialEMAs
+        sumMFEsArray, sumMAEsArray, counts = excursionSums(
+            df["price"].to_numpy(dtype=np.float64, copy=True),
+            df["ATR"].to_numpy(dtype=np.float64, copy=True),
+            df["longEntry"].to_numpy(dtype=np.bool_, copy=True),
+            df["shortEntry"].to_numpy(dtype=np.bool_, copy=True),
+            np.array(timePeriods, dtype=np.int64),
+        )
 
         E_ratios = []
         sumMFEs = []
         sumMAEs = []
 
-        for timePeriod in timePeriods:
-            # Rolling calculations
-            rolling_max = (
-                pd.Series(prices)
-                .rolling(window=timePeriod + 1)
-                .max()
-                .shift(-timePeriod)
-            )
-            rolling_min = (
-                pd.Series(prices)
-                .rolling(window=timePeriod + 1)
-                .min()
-                .shift(-timePeriod)
-            )
-
-            sumMFE, sumMAE, count = 0.0, 0.0, 0
-
-            for i in range(len(df) - timePeriod):
-                if long_entries[i] or short_entries[i]:
-                    currPrice = prices[i]
-                    currATR = atrs[i]
-
-                    if long_entries[i]:
-                        MFE = rolling_max[i] - currPrice
-                        MAE = currPrice - rolling_min[i]
-                    elif short_entries[i]:
-                        MFE = currPrice - rolling_min[i]
-                        MAE = rolling_max[i] - currPrice
-
-                    norMFE = MFE / currATR
-                    norMAE = MAE / currATR
-                    sumMFE += norMFE
-                    sumMAE += norMAE
-                    count += 1
-
+        for sumMFE, sumMAE, count in zip(sumMFEsArray, sumMAEsArray, counts):
             if count > 0:
                 # averageMFE = sumMFE / count
                 # averageMAE = sumMAE / count
@@ -1370,16 +1662,19 @@ def computeEdgeRatios(
 
         return sumMFEs, sumMAEs, E_ratios
 
-    # TBD can doing below using numpy
+    def computeEdgeRatiosAndSumsForDf(df):
+        return computeEdgeRatiosAndSumsForSec(computeBreakoutsAndATRs(df))
+
+    # securities are independent of each other, so they are processed concurrently
+    # (the rolling windows and the ATR kernel spend most of their time outside the GIL);
+    # the totals over all securities are still summed in the order of dfDict
+    with ThreadPoolExecutor() as executor:
+        secResults = list(executor.map(computeEdgeRatiosAndSumsForDf, dfDict.values()))
+
     E_ratios = {}
     allSecMFEs = [0] * numtimePeriods
     allSecMAEs = [0] * numtimePeriods
-    for (
-        sec,
-        df,
-    ) in dfDict.items():
-        df = computeBreakoutsAndATRs(df)
-        sumMFEs, sumMAEs, E_ratios_sec = computeEdgeRatiosAndSumsForSec(df)
+    for sec, (sumMFEs, sumMAEs, E_ratios_sec) in zip(dfDict.keys(), secResults):
         E_ratios[sec] = E_ratios_sec
         allSecMFEs = [x + y for x, y in zip(allSecMFEs, sumMFEs)]
         allSecMAEs = [x + y for x, y in zip(allSecMAEs, sumMAEs)]
@@ -1413,6 +1708,216 @@ def computeEdgeRatios(
         return E_ratios
 
 
+# explicit signatures compile the kernels once at import (and reuse the on-disk cache
+# after that) instead of on the first call inside a simulation
+@njit("float64(float64[:], float64, float64)", cache=True)
+def wilderATR(TR, n, ATR):
+    """
+    Applies Wilder's smoothing to an array of true ranges, starting from a seed ATR.
+
+    Args:
+        TR (numpy.ndarray): True ranges, in chronological order.
+        n (int): The ATR averaging range.
+        ATR (float): The ATR before the first element of TR.
+
+    Returns:
+        float: The ATR after the last element of TR.
+    """
+    for i in range(len(TR)):
+        ATR = (((n - 1) * ATR) + TR[i]) / n
+    return ATR
+
+
+@njit("void(float64[:], float64, float64, float64[:])", nogil=True, cache=True)
+def wilderATRRecurrence(TR, n, ATR, out):
+    """
+    Like wilderATR, but keeps the ATR after every true range.
+
+    Args:
+        TR (numpy.ndarray): True ranges, in chronological order.
+        n (int): The ATR averaging range.
+        ATR (float): The ATR before the first element of TR.
+        out (numpy.ndarray): Array the same length as TR, filled with the ATR after
+                             each true range.
+    """
+    for i in range(len(TR)):
+        ATR = (((n - 1) * ATR) + TR[i]) / n
+        out[i] = ATR
+
+
+@njit("UniTuple(float64[:], 2)(float64[:], int64)", cache=True)
+def rollingMinMax(prices, window):
+    """
+    Finds the minimum and maximum of every window of prices in a single pass, keeping
+    monotonic queues of the indices of candidate lows and highs.
+
+    Args:
+        prices (numpy.ndarray): Prices in chronological order.
+        window (int): Number of prices in each window.
+
+    Returns:
+        tuple: Arrays of the minimum and maximum of prices[i - window + 1 : i + 1] for
+               each i; the first window - 1 entries cover all prices up to i.
+    """
+    n = len(prices)
+    lows = np.empty(n)
+    highs = np.empty(n)
+    lowQueue = np.empty(n, dtype=np.int64)
+    highQueue = np.empty(n, dtype=np.int64)
+    lowHead = lowTail = highHead = highTail = 0
+    for i in range(n):
+        while lowTail > lowHead and prices[lowQueue[lowTail - 1]] >= prices[i]:
+            lowTail -= 1
+        lowQueue[lowTail] = i
+        lowTail += 1
+        if lowQueue[lowHead] <= i - window:
+            lowHead += 1
+
+        while highTail > highHead and prices[highQueue[highTail - 1]] <= prices[i]:
+            highTail -= 1
+        highQueue[highTail] = i
+        highTail += 1
+        if highQueue[highHead] <= i - window:
+            highHead += 1
+
+        lows[i] = prices[lowQueue[lowHead]]
+        highs[i] = prices[highQueue[highHead]]
+    return lows, highs
+
+
+@njit(
+    "Tuple((float64[:], float64[:], int64[:]))"
+    "(float64[:], float64[:], boolean[:], boolean[:], int64[:])",
+    nogil=True,
+    cache=True,
+)
+def excursionSums(prices, ATRs, longEntries, shortEntries, timePeriods):
+    """
+    Sums the ATR-normalized maximum favourable and adverse excursions of every entry
+    over each holding period, for the edge ratio.
+
+    Args:
+        prices (numpy.ndarray): Prices in chronological order.
+        ATRs (numpy.ndarray): The ATR at each price.
+        longEntries, shortEntries (numpy.ndarray): Whether each price is a long or a
+                                                   short entry.
+        timePeriods (numpy.ndarray): Holding periods, in number of prices.
+
+    Returns:
+        tuple: The MFE sums, MAE sums and numbers of entries for each time period; only
+               entries with timePeriod prices after them count.
+    """
+    numTimePeriods = len(timePeriods)
+    sumMFEs = np.zeros(numTimePeriods)
+    sumMAEs = np.zeros(numTimePeriods)
+    counts = np.zeros(numTimePeriods, dtype=np.int64)
+    for j in range(numTimePeriods):
+        timePeriod = timePeriods[j]
+        # the window ending timePeriod prices after an entry holds the entry price and
+        # the timePeriod prices following it
+        lows, highs = rollingMinMax(prices, timePeriod + 1)
+        sumMFE = 0.0
+        sumMAE = 0.0
+        count = 0
+        for i in range(len(prices) - timePeriod):
+            if longEntries[i] or shortEntries[i]:
+                currPrice = prices[i]
+                if longEntries[i]:
+                    MFE = highs[i + timePeriod] - currPrice
+                    MAE = currPrice - lows[i + timePeriod]
+                else:
+                    MFE = currPrice - lows[i + timePeriod]
+                    MAE = highs[i + timePeriod] - currPrice
+                sumMFE += MFE / ATRs[i]
+                sumMAE += MAE / ATRs[i]
+                count += 1
+        sumMFEs[j] = sumMFE
+        sumMAEs[j] = sumMAE
+        counts[j] = count
+    return sumMFEs, sumMAEs, counts
+
+
+@njit("void(float64[:], float64, float64, float64[:])", cache=True)
+def emaRecurrence(values, multiplier, EMA, out):
+    """
+    Runs the EMA update over an array of values, starting from a seed EMA.
+
+    Args:
+        values (numpy.ndarray): Values to average, in chronological order.
+        multiplier (float): Weight of each new value, smoothing / (length + 1).
+        EMA (float): The EMA before the first element of values.
+        out (numpy.ndarray): Array the same length as values, filled with the EMA
+                             after each value.
+    """
+    for i in range(len(values)):
+        EMA = values[i] * multiplier + (1 - multiplier) * EMA
+        out[i] = EMA
+
+
+@njit(
+    "UniTuple(float64[:, :], 3)(float64[:, :], float64[:], float64[:], float64[:], "
+    "float64[:], float64[:], float64[:], float64[:], float64[:], float64[:])",
+    cache=True,
+)
+def indicatorSeries(
+    prices,
+    prevPrices,
+    ATRs,
+    ATRAverageRanges,
+    EMAsLarger,
+    multipliersLarger,
+    EMAsSmaller,
+    multipliersSmaller,
+    signals,
+    signalMultipliers,
+):
+    """
+    Runs the per-tick ATR and MACD updates of every security over a whole simulation.
+
+    Args:
+        prices (numpy.ndarray): Prices with one row per tick and one column per security.
+        prevPrices (numpy.ndarray): Each security's price before the first tick.
+        ATRs (numpy.ndarray): Each security's ATR before the first tick.
+        ATRAverageRanges (numpy.ndarray): Each security's ATR averaging range.
+        EMAsLarger, EMAsSmaller (numpy.ndarray): Each security's larger and smaller EMAs
+                                                 before the first tick.
+        multipliersLarger, multipliersSmaller (numpy.ndarray): Their EMA multipliers.
+        signals (numpy.ndarray): Each security's signal before the first tick.
+        signalMultipliers (numpy.ndarray): The signal EMA multipliers.
+
+    Returns:
+        tuple: The ATR, MACD and signal at every tick, shaped like prices.
+    """
+    numTicks, numSecs = prices.shape
+    ATRSeries = np.empty((numTicks, numSecs))
+    MACDSeries = np.empty((numTicks, numSecs))
+    signalSeries = np.empty((numTicks, numSecs))
+    for secNo in range(numSecs):
+        prevPrice = prevPrices[secNo]
+        ATR = ATRs[secNo]
+        n = ATRAverageRanges[secNo]
+        EMA_larger = EMAsLarger[secNo]
+        multiplierLarger = multipliersLarger[secNo]
+        EMA_smaller = EMAsSmaller[secNo]
+        multiplierSmaller = multipliersSmaller[secNo]
+        signal = signals[secNo]
+        signalMultiplier = signalMultipliers[secNo]
+        for tickNo in range(numTicks):
+            price = prices[tickNo, secNo]
+            ATR = (((n - 1) * ATR) + abs(price - prevPrice)) / n
+            EMA_larger = price * multiplierLarger + (1 - multiplierLarger) * EMA_larger
+            EMA_smaller = (
+                price * multiplierSmaller + (1 - multiplierSmaller) * EMA_smaller
+            )
+            MACD = EMA_smaller - EMA_larger
+            signal = MACD * signalMultiplier + (1 - signalMultiplier) * signal
+            ATRSeries[tickNo, secNo] = ATR
+            MACDSeries[tickNo, secNo] = MACD
+            signalSeries[tickNo, secNo] = signal
+            prevPrice = price
+    return ATRSeries, MACDSeries, signalSeries
+
+
 def dataframe_to_excel(df, file_name=None):
     """
     Converts a DataFrame to an Excel file, formatting columns appropriately.
@@ -1443,17 +1948,25 @@ def dataframe_to_excel(df, file_name=None):
         for idx, col in enumerate(df):
             series = df[col]
             if pd.api.types.is_float_dtype(series):
+                # the widest formatted value is the largest or the most negative one,
+                # or one of the non-finite values (nan, inf, -inf)
+                values = series.to_numpy(dtype=np.float64)
+                isFinite = np.isfinite(values)
+                finiteValues = values[isFinite]
+                widestCandidates = list(np.unique(values[~isFinite]))
+                if len(finiteValues):
+                    widestCandidates += [finiteValues.max(), finiteValues.min()]
                 max_len = (
                     max(
-                        series.map(lambda x: len(f"{x:.2f}")).max(),
-                        len(str(series.name)),
+                        [len(f"{x:.2f}") for x in widestCandidates]
+                        + [len(str(series.name))]
                     )
                     + 1
                 )
                 worksheet.set_column(idx, idx, max_len, float_format)
             else:
                 max_len = (
-                    max(series.astype(str).map(len).max(), len(str(series.name))) + 1
+                    max(series.astype(str).str.len().max(), len(str(series.name))) + 1
                 )
                 worksheet.set_column(idx, idx, max_len)
 
@@ -1519,47 +2032,6 @@ def dataframe_to_csv(df):
     return output
 
 
-def appendToDataFrame(df, row, index=None, ignore_index=True):
-    """
-    Appends a new row to the DataFrame.
-
-    Parameters:
-        df (pd.DataFrame): The DataFrame to which the row will be appended.
-        row (dict or pd.Series): The new row to append. Can be a dictionary or a pandas Series.
-        ignore_index (bool): Whether to ignore the index of the appended row. If True, the index is reset.
-
-    Returns:
-        pd.DataFrame: A new DataFrame with the appended row.
-    """
-    # # Check if the row is a dictionary and convert it to a DataFrame
-    # if isinstance(row, dict):
-    #     row_df = pd.DataFrame([row])
-    # elif isinstance(row, pd.Series):
-    #     row_df = pd.DataFrame([row.values], columns=row.index)
-    # else:
-    #     raise ValueError("Row must be a dict or pd.Series")
-
-    # # Concatenate the original DataFrame with the new row DataFrame
-    # return pd.concat([df, row_df], ignore_index=ignore_index)
-
-    if index is None:
-        index = len(df.index)
-
-    # Ignore a specific warning by message and category
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", category=FutureWarning)
-        # Only within this block, the specified warning will be ignored
-        df.loc[index] = row
-
-
-def updateRowOfDataFrame(df, index, values, columns):
-    # Ignore a specific warning by message and category
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", category=FutureWarning)
-        # Only within this block, the specified warning will be ignored
-        df.loc[index, columns] = values
-
-
 # def retain_largest_continuous_sequence(df, time_column="time"):
 #     df[time_column] = pd.to_datetime(
 #         df[time_column]